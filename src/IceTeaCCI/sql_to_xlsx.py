@@ -44,7 +44,7 @@ def sql_to_xlsx(arglist=sys.argv[1:]):
   def log_field(text):
     if LOG_FIELDS: print(text)
 
-  with open(INPUT_FILE, 'r') as f:
+  with open(INPUT_FILE, 'r', encoding="utf-8") as f: # Must match OUTPUT_ENCODING in the other script
     sql_script = f.read()
 
   # Create a database connection in memory, to hold the tables generated by the script
@@ -1,10 +1,206 @@
 import argparse # Used for parsing command line arguments
 import sys # Used for accessing command line arguments
 import openpyxl # Used for reading from the XLSX file
-import json # Used to parse metadata in cell comments and file description, because it doesn't rely on whitespace like YAML
+from openpyxl.packaging.relationship import get_rels_path, get_dependents # Used for locating each worksheet's comments in the XLSX file
+from openpyxl.comments.comment_sheet import CommentSheet # Used for parsing the comments, since read-only mode doesn't load them
+from openpyxl.xml.constants import COMMENTS_NS # Used for finding the comments part among each worksheet's related parts
+from openpyxl.xml.functions import fromstring # Used for parsing the comments part's XML
+from openpyxl.utils.cell import coordinate_to_tuple # Used for finding which comments are on the header row
+import datetime # Used for detecting dates in records
+# JSON is used to parse metadata in cell comments and file description, because it doesn't rely on whitespace like YAML
+try:
+  from orjson import loads as json_loads # Much faster parser, used if installed
+except ImportError:
+  from json import loads as json_loads
+from concurrent.futures import ProcessPoolExecutor # Used for converting worksheets in parallel
+import itertools, shutil # Used for passing arguments to the worker processes and combining their output
 import os, platform, subprocess # Used for opening the generated XLSX file
 import send2trash # Used for deleting the XLSX file, so the user can get it back if this was done by accident
 
+AUTOGEN_PREFIX = "AUTOGENERATED, DO NOT EDIT!\n" # Must be kept identical with COMMENT_PREFIX in the other script
+AUTOGEN_PREFIX_LENGTH = len(AUTOGEN_PREFIX)
+DEFAULT_METADATA = {"type": "VARCHAR(255)", "not_null": False, "pk": 0} # Used for fields with no comment, assumed to be added by the user in Excel
+
+OUTPUT_BUFFER_SIZE = 1 << 20 # Amount of SQL to buffer before writing to disk
+OUTPUT_ENCODING = "utf-8"
+
+class XLSXParseError(Exception): pass
+
+# Logging functions
+def make_loggers(args):
+  def log_table_name(text):
+    if args.log_table_names: print(text)
+  def log_record(text):
+    if args.log_records: print(text)
+  def log_field(text):
+    if args.log_fields: print(text)
+  def log_warning(text):
+    if not args.suppress_warnings: print(text)
+  return log_table_name, log_record, log_field, log_warning
+
+# Escape any single quotes in a string
+def escape_string_sql(string):
+  if not isinstance(string, str):
+    return string
+
+  esc = string.replace("'", "''")
+  return esc
+
+# Formatters for writing a cell's value into an INSERT statement. One is picked per field, based on its type, before the records are read.
+def format_integer(value):
+  # Most values in an INTEGER field are already ints, so check for that first and skip the conversion
+  if type(value) is int: return str(value)
+  # CCI uses an empty string to indicate NULL, but OpenPyXL uses None
+  if value is None: return "''"
+  return str(int(value))
+def format_string(value):
+  if value is None: return "''"
+
+  # CCI stores data, including dates, as strings. For dates already present in the original SQL file, this is handled correctly.
+  # But for dates in fields that were previously empty, we need to convert them to strings.
+  if isinstance(value, datetime.date): # OpenPyXL reads date-formatted cells as datetimes
+    value = value.strftime("%Y-%m-%d")
+
+  # Ensure the value is a string, since Excel likes to auto-format booleans and numbers. It's then always a string, so escape it directly rather than through escape_string_sql().
+  return "'" + str(value).replace("'", "''") + "'"
+
+# Load the XLSX file
+# Read-only mode streams each sheet from the file instead of building every cell in memory up front, which is much faster and lighter for large files.
+# We only need the values, so formulas are read as their last calculated values.
+def load_workbook(path):
+  return openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+
+# Read-only mode doesn't load cell comments, so read them directly from the sheet's comments part of the XLSX file.
+# Only the header comments hold metadata, so comments on records are skipped.
+# Returns a dict of column numbers (1-based) to the text of that column's header comment.
+def load_header_comments(workbook, sheet):
+  comments = {}
+
+  # OpenPyXL has no public way to get at these, so fail clearly if a future version changes them
+  try:
+    archive = workbook._archive
+    worksheet_path = sheet._worksheet_path
+  except AttributeError as e:
+    raise XLSXParseError(f"Can't read field metadata comments with this version of OpenPyXL ({openpyxl.__version__}): {e}") from e
+
+  rels_path = get_rels_path(worksheet_path)
+  if rels_path not in archive.namelist():
+    return comments # No comments on this sheet
+
+  for rel in get_dependents(archive, rels_path).find(COMMENTS_NS):
+    comment_sheet = CommentSheet.from_tree(fromstring(archive.read(rel.target)))
+    for ref, comment in comment_sheet.comments:
+      row, column = coordinate_to_tuple(ref)
+      if row == 1:
+        comments[column] = comment.text
+  return comments
+
+# Write the SQL for one worksheet: the CREATE TABLE statement, followed by the records
+# The SQL file is written in binary mode, so each statement (or batch of records) is encoded to bytes once here before being written, instead of going through a text-mode file.
+def write_table(workbook, sheet, table_name, write, args):
+  log_table_name, log_record, log_field, log_warning = make_loggers(args)
+  log_table_name(f"Extracting table: {table_name} ({sheet.title})")
+  escaped_table_name = escape_string_sql(table_name)
+
+  # Read-only mode takes the sheet's size from the dimension tag saved in the XLSX file, which can be wrong (e.g. if another program wrote the file).
+  # Ignore it and read the rows that are actually there; the reads below are still bounded by the header row and the number of fields.
+  sheet.reset_dimensions()
+
+  # Collect list of fields in this table
+  fields = []
+  mapping_fields = [] # Fields which are not the primary key
+  field_metadata = []
+  header_comments = load_header_comments(workbook, sheet)
+  # Read the whole header row in one pass. The parser stops after the first row, so this doesn't read the records.
+  header_row = next(sheet.iter_rows(max_row=1, values_only=True), ())
+  for column, field_name in enumerate(header_row, start=1):
+    if not field_name: break # Stop at the first blank column
+    fields.append(field_name)
+
+    # Extract field metadata
+    comment_text = header_comments.get(column)
+    if comment_text:
+      if not comment_text.startswith(AUTOGEN_PREFIX):
+        raise XLSXParseError(f"Comment verification failed: '{comment_text}'")
+
+      metadata = json_loads(comment_text[AUTOGEN_PREFIX_LENGTH:])
+      field_metadata.append(metadata)
+    else:
+      log_warning(f"WARNING: No comment found for field {field_name}. Using default type: VARCHAR(255), not primary key.")
+      metadata = DEFAULT_METADATA
+      field_metadata.append(metadata)
+
+    log_field(f"Detected field: {field_name} with metadata {metadata}")
+  field_count = len(fields)
+  log_field(f"Detected {field_count} fields.")
+
+  # Build the field definitions
+  column_definitions = []
+  primary_key_fields = []
+  for field_name, metadata in zip(fields, field_metadata):
+    if metadata["pk"]:
+      # Primary key field doesn't get quotes around its name
+      definition = f'\t{escape_string_sql(field_name)} {metadata["type"]}'
+      primary_key_fields.append(field_name)
+    else:
+      definition = f'\t"{escape_string_sql(field_name)}" {metadata["type"]}'
+      mapping_fields.append(field_name)
+
+    if metadata["not_null"]: definition += " NOT NULL"
+    column_definitions.append(definition)
+
+  if len(primary_key_fields) > 1:
+    raise XLSXParseError(f"Table {table_name}: multiple primary key fields detected!")
+  if not primary_key_fields:
+    raise XLSXParseError(f"Table {table_name}: no primary key field detected!")
+
+  # Add the primary key
+  column_definitions.append(f'\tPRIMARY KEY ({escape_string_sql(primary_key_fields[0])})')
+
+  # Create the table, joining the definitions in one go rather than appending each piece separately
+  write((f'CREATE TABLE "{escaped_table_name}" (\n' + ",\n".join(column_definitions) + "\n);\n").encode(OUTPUT_ENCODING))
+
+  # Insert records into the table
+  # Records are grouped into multi-row INSERT statements of up to --batch-size records, which load much faster than one statement per record.
+  insert_prefix = f'INSERT INTO "{escaped_table_name}" VALUES('
+  batch = []
+  formatters = [format_integer if metadata["type"] == "INTEGER" else format_string for metadata in field_metadata]
+
+  # Look up anything used for every record once, before the loop, so it's a fast local variable lookup inside it
+  batch_size = args.batch_size
+  add_to_batch = batch.append
+  log_records = args.log_records
+
+  # Only the values are needed, so read them directly rather than going through a Cell object for each one.
+  # Cells past the last field are ignored (see End Detection in the README), so don't read them at all. This also pads short rows out to the last field.
+  for row_obj in sheet.iter_rows(min_row=2, max_col=field_count, values_only=True): # Skip the header row
+    # Skip empty rows
+    if not any(row_obj):
+      continue
+
+    record = ",".join([format_value(value) for format_value, value in zip(formatters, row_obj)])
+    add_to_batch(record)
+
+    if len(batch) >= batch_size:
+      write((insert_prefix + "),\n(".join(batch) + ");\n").encode(OUTPUT_ENCODING))
+      batch.clear() # Not reassigned, so add_to_batch still adds to it
+
+    # Checked here so the log message isn't built for every record when it won't be printed
+    if log_records: log_record(f"Record in table {escaped_table_name}: {record}")
+
+  # Insert any remaining records
+  if batch:
+    write((insert_prefix + "),\n(".join(batch) + ");\n").encode(OUTPUT_ENCODING))
+
+# Convert one worksheet into its own SQL file. This runs in a worker process when converting worksheets in parallel, so it opens its own copy of the workbook.
+def convert_sheet(args, sheet_name, table_name, output_file):
+  workbook = load_workbook(args.input)
+  try:
+    with open(output_file, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+      write_table(workbook, workbook[sheet_name], table_name, f.write, args)
+  finally:
+    workbook.close()
+
 def xlsx_to_sql(arglist=sys.argv[1:]):
   # Parse command line arguments
   parser = argparse.ArgumentParser()
@@ -17,6 +213,9 @@ def xlsx_to_sql(arglist=sys.argv[1:]):
 
   parser.add_argument("-sw", "--suppress-warnings", help="Do not display warnings", action="store_true")
 
+  parser.add_argument("-bs", "--batch-size", help="Maximum number of records per INSERT statement", type=int, default=1000)
+  parser.add_argument("-j", "--jobs", help="Number of worksheets to convert in parallel (default: number of CPUs)", type=int, default=os.cpu_count() or 1)
+
   output_options = parser.add_argument_group("XLSX file options")
   parser.add_argument("-d", "--delete-xlsx", help="Do not delete the XLSX file", action="store_true")
   parser.add_argument("-p", "--preserve-xlsx", help="Do not delete the XLSX file", action="store_false", dest='delete_xlsx')
@@ -31,174 +230,73 @@ def xlsx_to_sql(arglist=sys.argv[1:]):
 
   args = parser.parse_args(arglist)
 
-  # Output options
-  LOG_TABLE_NAMES = args.log_table_names
-  LOG_RECORDS = args.log_records
-  LOG_FIELDS = args.log_fields
-
-  DISPLAY_WARNINGS = not args.suppress_warnings
+  if args.batch_size < 1:
+    parser.error("--batch-size must be at least 1")
+  if args.jobs < 1:
+    parser.error("--jobs must be at least 1")
 
+  # Output options
   OPEN_FILE = args.open_file
   DELETE_XLSX = args.delete_xlsx
 
+  JOBS = args.jobs
+
   INPUT_FILE = args.input
   OUTPUT_FILE = args.output
 
-  AUTOGEN_PREFIX = "AUTOGENERATED, DO NOT EDIT!\n" # Must be kept identical with COMMENT_PREFIX in the other script
-  DEFAULT_METADATA = {"type": "VARCHAR(255)", "not_null": False, "pk": 0} # Used for fields with no comment, assumed to be added by the user in Excel
-
-  # Logging functions
-  def log_table_name(text):
-    if LOG_TABLE_NAMES: print(text)
-  def log_record(text):
-    if LOG_RECORDS: print(text)
-  def log_field(text):
-    if LOG_FIELDS: print(text)
-  def log_warning(text):
-    if DISPLAY_WARNINGS: print(text)
-
-  # Escape any single quotes in a string
-  def escape_string_sql(string):
-    if not isinstance(string, str):
-      return string
-    
-    esc = string.replace("'", "''")
-    return esc
-
-  class XLSXParseError(Exception): pass
-
-  # Load the XLSX file
-  workbook = openpyxl.load_workbook(INPUT_FILE)
+  workbook = load_workbook(INPUT_FILE)
 
   # Get the document's description, where we're storing metadata about the tables
   desc_text = workbook.properties.description
-  prefix = desc_text[:len(AUTOGEN_PREFIX)]
-  suffix = desc_text[len(AUTOGEN_PREFIX):]
-
-  if prefix != AUTOGEN_PREFIX:
+  if not desc_text or not desc_text.startswith(AUTOGEN_PREFIX):
     raise XLSXParseError(f"Comment verification failed: '{desc_text}'")
-  
-  metadata = json.loads(suffix)
-  table_names = metadata["table_names"]
-
-  # Variable to hold contents of the SQL script
-  sql_script = "BEGIN TRANSACTION;\n"
-
-  # For each worksheet, create the corresponding table in the SQL script
-  for sheet in workbook.worksheets:
-    sheet_name = sheet.title
-    table_name = table_names[sheet_name]
-    log_table_name(f"Extracting table: {table_name} ({sheet_name})")
-
-    # Collect list of fields in this table
-    fields = []
-    mapping_fields = [] # Fields which are not the primary key
-    field_metadata = []
-    column = 1
-    cell = sheet.cell(row=1, column=column)
-    while cell.value:
-      field_name = cell.value
-      fields.append(field_name)
-
-      # Extract field metadata
-      if cell.comment:
-        comment_text = cell.comment.text
-        prefix = comment_text[:len(AUTOGEN_PREFIX)]
-        suffix = comment_text[len(AUTOGEN_PREFIX):]
-
-        if prefix != AUTOGEN_PREFIX:
-          raise XLSXParseError(f"Comment verification failed: '{comment_text}'")
-
-        metadata = json.loads(suffix)
-        field_metadata.append(metadata)
-      else:
-        log_warning(f"WARNING: No comment found for field {field_name}. Using default type: VARCHAR(255), not primary key.")
-        metadata = DEFAULT_METADATA
-        field_metadata.append(metadata)
-
-      column += 1
-      cell = sheet.cell(row=1, column=column)
-      log_field(f"Detected field: {field_name} with metadata {metadata}")
-    log_field(f"Detected {len(fields)} fields. The final, empty cell's value's type was: {str(type(cell.value))}")
-
-    # Create the table
-    sql_script += f'CREATE TABLE "{escape_string_sql(table_name)}" (\n'
-
-    primary_key_field = None
-
-    # Add the fields
-    for column, field_name in enumerate(fields):
-      metadata = field_metadata[column]
-      if metadata["pk"]:
-        if primary_key_field is not None:
-          raise XLSXParseError(f"Table {table_name}: multiple primary key fields detected!")
-        
-        primary_key_field = field_name
-
-      # Primary key field doesn't get quotes around its name
-      if primary_key_field == field_name:
-        sql_script += f'\t{escape_string_sql(field_name)}'
-      else:
-        sql_script += f'\t"{escape_string_sql(field_name)}"'
-        mapping_fields.append(field_name)
-
-      sql_script += f' {metadata["type"]}'
-      if metadata["not_null"]: sql_script += " NOT NULL"
-      sql_script += ",\n"
-
-    # Add the primary key
-    if primary_key_field is not None:
-      sql_script += f'\tPRIMARY KEY ({escape_string_sql(primary_key_field)})\n'
-    else:
-      raise XLSXParseError(f"Table {table_name}: no primary key field detected!")
-
-    # End the table with close-paren
-    sql_script += ");\n"
-
-    # Insert records into the table
-    for row_index, row_obj in enumerate(sheet.rows):
-      if row_index == 0: continue # Skip the header row
-
-      # Skip empty rows
-      if not any(cell.value for cell in row_obj):
-        continue
-
-      values = []
-      for column_index, field in enumerate(fields):
-        cell = sheet.cell(row=row_index+1, column=column_index+1) # Remember, 1-based indexing!
-        value = cell.value
-
-        # CCI uses an empty string to indicate NULL, but OpenPyXL uses None
-        if value is None: value = ''
 
-        # CCI stores data, including dates, as strings. For dates already present in the original SQL file, this is handled correctly.
-        # But for dates in fields that were previously empty, we need to convert them to strings.
-        if cell.is_date:
-          value = cell.value.strftime("%Y-%m-%d")
-
-        target_type = field_metadata[column_index]["type"]
-        if target_type == "INTEGER":
-          value = int(value)
-        else:
-          value = str(value) # Ensure the value is a string, since Excel likes to auto-format booleans and numbers
-
-        values.append(value)
-
-      sql_script += f'INSERT INTO "{escape_string_sql(table_name)}" VALUES('
-      for column, value in enumerate(values):
-        if column > 0: sql_script += ","
-        if isinstance(value, str): sql_script += f"'{escape_string_sql(value)}'"
-        else: sql_script += f"{escape_string_sql(value)}"
-      sql_script += ");\n"
-
-      log_record(f"Record in table {escape_string_sql(table_name)}: {escape_string_sql(values)}")
+  metadata = json_loads(desc_text[AUTOGEN_PREFIX_LENGTH:])
+  table_names = metadata["table_names"]
 
-  # End the SQL file
-  sql_script += "COMMIT;\n"
+  # Only worksheets hold tables. Other sheets, like charts the user added in Excel, are skipped.
+  sheet_names = [sheet.title for sheet in workbook.worksheets]
+  sheet_table_names = [table_names[sheet_name] for sheet_name in sheet_names]
 
   # Save the SQL file
-  with open(OUTPUT_FILE, 'w') as f:
-    f.write(sql_script)
+  # It's written to a temporary file first and only moved into place once complete, so an error partway through doesn't leave a half-written SQL file in place of the old one.
+  temp_output_file = OUTPUT_FILE + ".tmp"
+  part_files = []
+  try:
+    # Worksheets don't depend on each other, so with multiple CPUs each one is converted by a separate process into its own file, and the files are combined in order afterwards.
+    if JOBS > 1 and len(sheet_names) > 1:
+      workbook.close() # Each worker opens its own copy
+      part_files = [f"{temp_output_file}.{index}" for index in range(len(sheet_names))]
+      with ProcessPoolExecutor(max_workers=min(JOBS, len(sheet_names))) as executor:
+        # Collecting the results re-raises any error from a worker here
+        list(executor.map(convert_sheet, itertools.repeat(args), sheet_names, sheet_table_names, part_files))
+
+    # Write the SQL script to the file as it's generated, rather than holding the whole script in memory
+    with open(temp_output_file, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+      f.write(b"BEGIN TRANSACTION;\n")
+
+      if part_files:
+        for part_file in part_files:
+          with open(part_file, 'rb') as part:
+            shutil.copyfileobj(part, f)
+      else:
+        # For each worksheet, create the corresponding table in the SQL script
+        for sheet_name, table_name in zip(sheet_names, sheet_table_names):
+          write_table(workbook, workbook[sheet_name], table_name, f.write, args)
+
+      # End the SQL file
+      f.write(b"COMMIT;\n")
+
+    # Replace the old SQL file. This can fail too (e.g. on Windows, if the file is open in another program), so the temporary file is cleaned up below in that case as well.
+    os.replace(temp_output_file, OUTPUT_FILE)
+  except BaseException:
+    if os.path.exists(temp_output_file): os.remove(temp_output_file)
+    raise
+  finally:
+    # Read-only workbooks keep the XLSX file open until closed
+    workbook.close()
+    for part_file in part_files:
+      if os.path.exists(part_file): os.remove(part_file)
 
   # Delete the XLSX file
   if DELETE_XLSX:
@@ -0,0 +1,141 @@
+import datetime, os, re, shutil, sqlite3, tempfile, unittest, zipfile
+import openpyxl
+from openpyxl.chart import BarChart, Reference
+
+from IceTeaCCI.sql_to_xlsx import sql_to_xlsx
+from IceTeaCCI.xlsx_to_sql import xlsx_to_sql
+
+SAMPLE_SQL = os.path.join(os.path.dirname(__file__), "datasets", "sample.sql")
+
+# What the sample converts back to with --batch-size 1: one INSERT per record, as before batching was added
+ONE_INSERT_PER_RECORD_SQL = """\
+BEGIN TRANSACTION;
+CREATE TABLE "People" (
+\tid INTEGER NOT NULL,
+\t"Name" VARCHAR(255),
+\t"Nickname" VARCHAR(255),
+\tPRIMARY KEY (id)
+);
+INSERT INTO "People" VALUES(1,'Nicholas','Nick');
+INSERT INTO "People" VALUES(2,'Lillian','Lily');
+INSERT INTO "People" VALUES(3,'Jane','Jenny');
+INSERT INTO "People" VALUES(4,'Wenceslas','');
+CREATE TABLE "Rocks" (
+\tid INTEGER NOT NULL,
+\t"Type" VARCHAR(255),
+\t"Origin" VARCHAR(255),
+\tPRIMARY KEY (id)
+);
+INSERT INTO "Rocks" VALUES(1,'Limestone','a mysterious cave');
+INSERT INTO "Rocks" VALUES(2,'Granite','a riverbed, long since dried up');
+INSERT INTO "Rocks" VALUES(3,'Obsidian','found under my pillow after a particulaly wild night');
+INSERT INTO "Rocks" VALUES(4,'Gneiss','saw it by the side of the road and thought it looked gneiss');
+INSERT INTO "Rocks" VALUES(5,'Chunk of Plastic','');
+INSERT INTO "Rocks" VALUES(6,'Sandstone','a pile of sand had an unfortunate run-in with Medusa');
+COMMIT;
+"""
+
+# A table with an INTEGER field that isn't the primary key, with an empty value (CCI's NULL) in the second record
+COUNTS_SQL = """\
+BEGIN TRANSACTION;
+CREATE TABLE "Counts" (
+\tid INTEGER NOT NULL,
+\t"Name" VARCHAR(255),
+\t"Count" INTEGER,
+\tPRIMARY KEY (id)
+);
+INSERT INTO "Counts" VALUES('1','Apples','3');
+INSERT INTO "Counts" VALUES('2','Pears','');
+COMMIT;
+"""
+
+# Load a SQL script into an in-memory database and return the contents of each table
+def read_tables(sql_file):
+  with open(sql_file, 'r', encoding="utf-8") as f:
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(f.read())
+  tables = [table[0] for table in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+  return {table: sorted(conn.execute(f'SELECT * FROM "{table}"').fetchall()) for table in tables}
+
+class TestXLSXToSQL(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.xlsx_file = os.path.join(self.dir, "generated.xlsx")
+    self.sql_file = os.path.join(self.dir, "sample.sql")
+    sql_to_xlsx(["-i", SAMPLE_SQL, "-o", self.xlsx_file, "-nof"])
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_round_trip(self):
+    xlsx_to_sql(["-i", self.xlsx_file, "-o", self.sql_file, "-p", "-j", "1"])
+    self.assertEqual(read_tables(self.sql_file), read_tables(SAMPLE_SQL))
+
+  def test_batch_size(self):
+    # Sample has 4 People and 6 Rocks. A batch size of 2 fills every batch; 4 leaves a partial batch for Rocks.
+    for batch_size, insert_count in (("2", 5), ("4", 3)):
+      with self.subTest(batch_size=batch_size):
+        xlsx_to_sql(["-i", self.xlsx_file, "-o", self.sql_file, "-p", "-j", "1", "-bs", batch_size])
+        with open(self.sql_file, 'r', encoding="utf-8") as f:
+          self.assertEqual(f.read().count("INSERT INTO"), insert_count)
+        self.assertEqual(read_tables(self.sql_file), read_tables(SAMPLE_SQL))
+
+  def test_batch_size_one(self):
+    xlsx_to_sql(["-i", self.xlsx_file, "-o", self.sql_file, "-p", "-bs", "1"])
+    with open(self.sql_file, 'r', encoding="utf-8") as f:
+      self.assertEqual(f.read(), ONE_INSERT_PER_RECORD_SQL)
+
+  # Empty INTEGER cells, dates typed into new fields, and single quotes, each as the user would leave them in Excel
+  def test_value_formatting(self):
+    counts_sql_file = os.path.join(self.dir, "counts.sql")
+    with open(counts_sql_file, 'w', encoding="utf-8") as f:
+      f.write(COUNTS_SQL)
+    sql_to_xlsx(["-i", counts_sql_file, "-o", self.xlsx_file, "-nof"])
+
+    workbook = openpyxl.load_workbook(self.xlsx_file)
+    sheet = workbook["Counts"]
+    sheet["B2"] = "Farmer's apples"
+    sheet["D1"] = "Picked" # New field with no comment, so VARCHAR(255)
+    sheet["D1"].comment = None
+    sheet["D2"] = datetime.datetime(2024, 9, 30)
+    sheet["D2"].number_format = "yyyy-mm-dd"
+    workbook.save(self.xlsx_file)
+
+    xlsx_to_sql(["-i", self.xlsx_file, "-o", self.sql_file, "-p", "-sw", "-bs", "1"])
+    with open(self.sql_file, 'r', encoding="utf-8") as f:
+      inserts = [line for line in f.read().splitlines() if line.startswith("INSERT")]
+    self.assertEqual(inserts, [
+      """INSERT INTO "Counts" VALUES(1,'Farmer''s apples',3,'2024-09-30');""",
+      """INSERT INTO "Counts" VALUES(2,'Pears','','');""",
+    ])
+
+  # Read-only mode trusts the dimension tag in each worksheet, which other programs don't always get right
+  def test_wrong_dimension_tag(self):
+    bad_xlsx_file = os.path.join(self.dir, "bad_dimension.xlsx")
+    with zipfile.ZipFile(self.xlsx_file) as source, zipfile.ZipFile(bad_xlsx_file, "w") as target:
+      for item in source.infolist():
+        data = source.read(item.filename)
+        if item.filename.startswith("xl/worksheets/sheet"):
+          data = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', data)
+        target.writestr(item, data)
+
+    for jobs in ("1", "2"):
+      with self.subTest(jobs=jobs):
+        xlsx_to_sql(["-i", bad_xlsx_file, "-o", self.sql_file, "-p", "-j", jobs])
+        self.assertEqual(read_tables(self.sql_file), read_tables(SAMPLE_SQL))
+
+  # Users may add other kinds of sheets in Excel, like charts. Those don't hold tables and should be skipped.
+  def test_chart_sheet(self):
+    workbook = openpyxl.load_workbook(self.xlsx_file)
+    chart = BarChart()
+    chart.add_data(Reference(workbook["People"], min_col=1, min_row=1, max_row=5), titles_from_data=True)
+    workbook.create_chartsheet("Chart1", 1).add_chart(chart) # Between the two worksheets
+    workbook.save(self.xlsx_file)
+
+    for jobs in ("1", "2"):
+      with self.subTest(jobs=jobs):
+        xlsx_to_sql(["-i", self.xlsx_file, "-o", self.sql_file, "-p", "-j", jobs])
+        self.assertEqual(read_tables(self.sql_file), read_tables(SAMPLE_SQL))
+
+if __name__ == "__main__":
+  unittest.main()